@@ -0,0 +1,88 @@
+"""
+Benchmark do índice de livros similares com dados sintéticos
+
+Uso: python bench_similarity.py [quantidade ...]  (padrão: 100000 1000000)
+"""
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from similarity import COMPACT_THRESHOLD, SimilarityIndex
+
+QUERIES = 1000
+
+
+def synthetic_rows(count: int, seed: int = 42):
+    """Gera livros sintéticos com distribuição de atributos próxima de um acervo real"""
+    rng = random.Random(seed)
+    authors = [f"Autor {i}" for i in range(max(10, count // 5))]
+    tags = [f"Tag {i}" for i in range(2000)]
+    publishers = [f"Editora {i}" for i in range(500)]
+    languages = ["Português", "Inglês", "Espanhol", "Francês"]
+    for i in range(count):
+        yield (
+            str(i),
+            rng.sample(tags, rng.randint(1, 5)),
+            rng.sample(authors, rng.randint(1, 2)),
+            rng.choice(publishers),
+            rng.choices(languages, weights=[60, 30, 5, 5])[0],
+        )
+
+
+def _percentiles(latencies):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return f"p50 {p50:6.2f} ms | p99 {p99:6.2f} ms"
+
+
+def _timed_queries(index: SimilarityIndex, ids, rng: random.Random, queries: int = QUERIES):
+    latencies = []
+    for _ in range(queries):
+        book_id = rng.choice(ids)
+        start = time.perf_counter()
+        index.similar(book_id, 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(count: int) -> None:
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    index.build(synthetic_rows(count))
+    build_time = time.perf_counter() - start
+    print(f"{count:>9} livros | build {build_time:6.1f} s")
+
+    rng = random.Random(7)
+    ids = [str(i) for i in range(count)]
+    print(f"{'':>9}   estático              | consulta {_percentiles(_timed_queries(index, ids, rng))}")
+
+    # Pendências logo abaixo do limite de recompactação
+    extra = [
+        SimpleNamespace(id=book_id, tags=tags, autores=autores, editora=editora, idioma=idioma)
+        for book_id, tags, autores, editora, idioma in synthetic_rows(2 * COMPACT_THRESHOLD, seed=99)
+    ]
+    for book in extra[:COMPACT_THRESHOLD - 1]:
+        book.id = f"novo-{book.id}"
+        index.add(book)
+    mixed = ids + [book.id for book in extra[:COMPACT_THRESHOLD - 1]]
+    print(f"{'':>9}   {COMPACT_THRESHOLD - 1} pendentes        | consulta {_percentiles(_timed_queries(index, mixed, rng))}")
+
+    # Inclusões intercaladas com consultas, atravessando a recompactação
+    query_latencies, add_latencies = [], []
+    for book in extra[COMPACT_THRESHOLD - 1:]:
+        book.id = f"novo-{book.id}"
+        start = time.perf_counter()
+        index.add(book)
+        add_latencies.append((time.perf_counter() - start) * 1000)
+        query_latencies.extend(_timed_queries(index, mixed, rng, queries=5))
+    index.wait_for_compaction()
+    print(f"{'':>9}   com alterações        | consulta {_percentiles(query_latencies)}"
+          f" | inclusão {_percentiles(add_latencies)}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,78 @@
+"""
+Benchmark do índice de autocompletar com dados sintéticos
+
+Uso: python bench_suggest.py [quantidade ...]  (padrão: 100000 1000000)
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from suggest import COMPACT_THRESHOLD, SuggestIndex, book_terms
+
+QUERIES = 10000
+WORDS = [
+    "amor", "arte", "código", "dados", "guerra", "história", "império", "jardim", "livro",
+    "mar", "noite", "paz", "poder", "python", "sombra", "tempo", "vida", "água", "éter",
+]
+
+
+def synthetic_rows(count: int, seed: int = 42):
+    """Gera livros sintéticos com títulos de 1 a 5 palavras"""
+    rng = random.Random(seed)
+    authors = [f"{rng.choice(WORDS).title()} Autor {i}" for i in range(max(10, count // 5))]
+    tags = [f"Tag {rng.choice(WORDS)} {i}" for i in range(2000)]
+    publishers = [f"Editora {i}" for i in range(500)]
+    for i in range(count):
+        titulo = " ".join(rng.choices(WORDS, k=rng.randint(1, 5))) + f" {i}"
+        yield titulo, rng.sample(authors, rng.randint(1, 2)), rng.choice(publishers), rng.sample(tags, 3)
+
+
+def _percentiles(latencies):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return f"p50 {p50:5.3f} ms | p99 {p99:5.3f} ms"
+
+
+def _timed_queries(index: SuggestIndex, rng: random.Random, queries: int):
+    latencies = []
+    for _ in range(queries):
+        word = rng.choice(WORDS)
+        query = word[:rng.randint(1, len(word))]
+        start = time.perf_counter()
+        index.suggest(query, 10)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(count: int) -> None:
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.build(synthetic_rows(count))
+    build_time = time.perf_counter() - start
+    print(f"{count:>9} livros | {len(index._keys):>9} chaves | build {build_time:5.1f} s")
+
+    rng = random.Random(7)
+    print(f"{'':>9}   estático       | consulta {_percentiles(_timed_queries(index, rng, QUERIES))}")
+
+    # Inclusões, alterações e exclusões intercaladas com consultas, atravessando
+    # compactações em segundo plano (cada título novo gera até 4 chaves pendentes)
+    mutations = list(synthetic_rows(COMPACT_THRESHOLD, seed=99))
+    query_latencies, write_latencies = [], []
+    for i, row in enumerate(mutations):
+        terms = book_terms(f"novo {row[0]}", *row[1:])
+        start = time.perf_counter()
+        index.add_terms(terms)
+        if i % 3 == 0:
+            index.remove_terms(terms)
+        write_latencies.append((time.perf_counter() - start) * 1000)
+        query_latencies.extend(_timed_queries(index, rng, 5))
+    index.wait_for_compaction()
+    print(f"{'':>9}   com alterações | consulta {_percentiles(query_latencies)}"
+          f" | escrita {_percentiles(write_latencies)}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    for size in sizes:
+        run(size)
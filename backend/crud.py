@@ -4,6 +4,9 @@ from typing import List, Optional
 from datetime import datetime, timezone
 import models
 import schemas
+from isbn import canonical_isbn13, normalized_isbns
+from similarity import similarity_index
+from suggest import book_terms_of, suggest_index
 
 
 # Book CRUD
@@ -12,6 +15,60 @@ def get_book(db: Session, book_id: str) -> Optional[models.Book]:
     return db.query(models.Book).filter(models.Book.id == book_id).first()
 
 
+def get_book_by_isbn(db: Session, isbn: str) -> Optional[models.Book]:
+    """Busca um livro por ISBN-10 ou ISBN-13, com ou sem hífens"""
+    isbn13 = canonical_isbn13(isbn)
+    if not isbn13:
+        return None
+    return db.query(models.Book).filter(models.Book.isbn13_normalizado == isbn13).first()
+
+
+def find_isbn_conflict(
+    db: Session,
+    isbn10: Optional[str],
+    isbn13: Optional[str],
+    exclude_id: Optional[str] = None
+) -> Optional[models.Book]:
+    """Retorna outro livro já cadastrado com o mesmo ISBN, se existir"""
+    for isbn in (isbn13, isbn10):
+        existing = get_book_by_isbn(db, isbn) if isbn else None
+        if existing and existing.id != exclude_id:
+            return existing
+    return None
+
+
+def backfill_isbns(db: Session, batch_size: int = 1000) -> int:
+    """Preenche as colunas normalizadas de ISBN de livros cadastrados antes delas existirem
+
+    ISBNs com dígito verificador errado também são normalizados; apenas valores
+    sem o formato de ISBN-10/ISBN-13 ficam sem coluna normalizada.
+    """
+    rows = db.query(
+        models.Book.id, models.Book.isbn10, models.Book.isbn13, models.Book.atualizado_em
+    ).filter(
+        models.Book.isbn13_normalizado.is_(None),
+        or_(models.Book.isbn10.isnot(None), models.Book.isbn13.isnot(None))
+    ).all()
+
+    mappings = []
+    for book_id, isbn10, isbn13, atualizado_em in rows:
+        isbn10_norm, isbn13_norm = normalized_isbns(isbn10, isbn13)
+        if isbn13_norm:
+            # Mantém atualizado_em para não alterar a ordenação da listagem
+            mappings.append({
+                "id": book_id,
+                "isbn10_normalizado": isbn10_norm,
+                "isbn13_normalizado": isbn13_norm,
+                "atualizado_em": atualizado_em,
+            })
+
+    for start in range(0, len(mappings), batch_size):
+        db.bulk_update_mappings(models.Book, mappings[start:start + batch_size])
+    if mappings:
+        db.commit()
+    return len(mappings)
+
+
 def get_books(
     db: Session,
     skip: int = 0,
@@ -57,6 +114,8 @@ def create_book(db: Session, book: schemas.BookCreate) -> models.Book:
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    similarity_index.add(db_book)
+    suggest_index.add(db_book)
     return db_book
 
 
@@ -66,6 +125,7 @@ def update_book(db: Session, book_id: str, book_update: schemas.BookUpdate) -> O
     if not db_book:
         return None
 
+    old_terms = book_terms_of(db_book)
     update_data = book_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_book, key, value)
@@ -73,6 +133,9 @@ def update_book(db: Session, book_id: str, book_update: schemas.BookUpdate) -> O
     db_book.atualizado_em = datetime.now(timezone.utc)
     db.commit()
     db.refresh(db_book)
+    similarity_index.add(db_book)
+    suggest_index.remove_terms(old_terms)
+    suggest_index.add(db_book)
     return db_book
 
 
@@ -82,11 +145,37 @@ def delete_book(db: Session, book_id: str) -> bool:
     if not db_book:
         return False
 
+    old_terms = book_terms_of(db_book)
     db.delete(db_book)
     db.commit()
+    similarity_index.remove(book_id)
+    suggest_index.remove_terms(old_terms)
     return True
 
 
+def get_similar_books(db: Session, book_id: str, k: int = 10) -> List[dict]:
+    """Busca os k livros mais similares usando o índice em memória"""
+    ranked = similarity_index.similar(book_id, k)
+    if not ranked:
+        return []
+
+    rows = db.query(
+        models.Book.id, models.Book.titulo, models.Book.autores, models.Book.capa_url
+    ).filter(models.Book.id.in_([other_id for other_id, _ in ranked])).all()
+    by_id = {row.id: row for row in rows}
+    return [
+        {
+            "id": other_id,
+            "titulo": by_id[other_id].titulo,
+            "autores": by_id[other_id].autores,
+            "capa_url": by_id[other_id].capa_url,
+            "score": score,
+        }
+        for other_id, score in ranked
+        if other_id in by_id
+    ]
+
+
 def toggle_favorite(db: Session, book_id: str) -> Optional[models.Book]:
     """Alterna status de favorito de um livro"""
     db_book = get_book(db, book_id)
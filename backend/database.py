@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -26,3 +26,21 @@ def get_db():
 def init_db():
     """Inicializa o banco de dados criando todas as tabelas"""
     Base.metadata.create_all(bind=engine)
+
+
+def upgrade_db():
+    """Adiciona colunas e índices novos a tabelas criadas por versões anteriores"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        # Buscas usam só o ISBN-13 normalizado; o índice do ISBN-10 não é mais criado
+        conn.execute(text("DROP INDEX IF EXISTS ix_books_isbn10_normalizado"))
@@ -0,0 +1,250 @@
+"""
+Detecção de livros duplicados por ISBN e por similaridade de título/autores
+
+A comparação aproximada usa assinaturas MinHash sobre trigramas de caracteres
+e LSH por bandas: apenas livros que caem no mesmo balde em alguma banda são
+comparados, evitando a comparação de todos os pares do acervo.
+
+Como percorre o acervo inteiro, a detecção roda como job em segundo plano,
+com progresso consultável, no mesmo formato do enriquecimento de metadados.
+"""
+import re
+import threading
+import unicodedata
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+NUM_PERM = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+SMALL_BUCKET = 64
+BATCH_SIZE = 10000
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240115)
+_PERM_A = _rng.integers(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Letras latinas que a decomposição Unicode não reduz a uma letra ASCII com acento
+_TRANSLITERATION = str.maketrans({
+    "ß": "ss", "ẞ": "SS", "æ": "ae", "Æ": "AE", "œ": "oe", "Œ": "OE",
+    "ø": "o", "Ø": "O", "ł": "l", "Ł": "L", "đ": "d", "Đ": "D",
+    "ð": "d", "Ð": "D", "þ": "th", "Þ": "TH", "ı": "i", "ŋ": "n", "Ŋ": "N",
+})
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Remove acentos e pontuação, deixando o texto em minúsculas
+
+    Letras como ß, ł e ø são transliteradas. Escritas não latinas (cirílico,
+    grego, CJK etc.) não têm equivalente ASCII e são descartadas, então um texto
+    só com elas fica vazio.
+    """
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value.translate(_TRANSLITERATION))
+    ascii_text = decomposed.encode("ascii", "ignore").decode("ascii").lower()
+    return _NON_ALNUM.sub(" ", ascii_text).strip()
+
+
+def book_key(titulo: Optional[str], autores: Optional[Sequence[str]]) -> str:
+    """Texto usado na comparação aproximada: título seguido dos autores"""
+    nomes = " ".join(sorted(normalize_text(a) for a in (autores or [])))
+    return f"{normalize_text(titulo)} {nomes}".strip()
+
+
+def _shingles(text: str) -> np.ndarray:
+    padded = f" {text} "
+    grams = {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+    return np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)
+    ) % _PRIME
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """Calcula a assinatura MinHash de um texto já normalizado"""
+    hashes = _shingles(text)
+    permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % _PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def _band_hashes(signatures: np.ndarray, band: int) -> np.ndarray:
+    cols = signatures[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].astype(np.uint64)
+    h = np.zeros(len(signatures), dtype=np.uint64)
+    for i in range(cols.shape[1]):
+        h = (h * np.uint64(1000003)) ^ cols[:, i]
+    return h
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def similar_pairs(signatures: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """Retorna pares de índices com similaridade de Jaccard estimada >= threshold
+
+    Em cada banda os livros são ordenados pelo hash da banda. Baldes com até
+    SMALL_BUCKET livros são comparados par a par. Baldes maiores, em geral
+    formados por títulos muito curtos ou repetidos, são comparados apenas
+    contra o seu primeiro elemento para manter o custo linear; nesses baldes um
+    par só é encontrado se ambos forem similares ao primeiro livro ou se
+    voltarem a se encontrar em um balde pequeno de outra banda.
+    """
+    pairs: Set[Tuple[int, int]] = set()
+    if len(signatures) < 2:
+        return []
+
+    for band in range(BANDS):
+        hashes = _band_hashes(signatures, band)
+        order = np.argsort(hashes, kind="stable")
+        sorted_hashes = hashes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_hashes[1:] != sorted_hashes[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = order[start:end]
+            if len(members) <= SMALL_BUCKET:
+                bucket = signatures[members]
+                scores = (bucket[:, None, :] == bucket[None, :, :]).mean(axis=2)
+                left, right = np.nonzero(np.triu(scores >= threshold, k=1))
+            else:
+                scores = (signatures[members[1:]] == signatures[members[0]]).mean(axis=1)
+                right = np.flatnonzero(scores >= threshold) + 1
+                left = np.zeros(len(right), dtype=np.int64)
+            for a, b in zip(members[left].tolist(), members[right].tolist()):
+                pairs.add((a, b) if a < b else (b, a))
+    return sorted(pairs)
+
+
+def find_duplicates(db: Session, threshold: float = 0.8, job: Optional["DuplicateJob"] = None) -> List[dict]:
+    """Agrupa livros duplicados combinando ISBN idêntico e título/autores similares"""
+    if job is not None:
+        job.total = db.query(func.count(models.Book.id)).scalar()
+    ids: List[str] = []
+    titulos: List[str] = []
+    autores: List[list] = []
+    isbns: List[Optional[str]] = []
+    signatures: List[np.ndarray] = []
+    signed: List[int] = []
+
+    query = db.query(
+        models.Book.id, models.Book.titulo, models.Book.autores, models.Book.isbn13_normalizado
+    ).order_by(models.Book.id).yield_per(BATCH_SIZE)
+    for book_id, titulo, book_autores, isbn13 in query:
+        index = len(ids)
+        ids.append(book_id)
+        titulos.append(titulo)
+        autores.append(book_autores or [])
+        isbns.append(isbn13)
+        key = book_key(titulo, book_autores)
+        if key:
+            signatures.append(minhash_signature(key))
+            signed.append(index)
+        if job is not None:
+            job.processados += 1
+
+    uf = _UnionFind(len(ids))
+    motivos: Dict[Tuple[int, int], str] = {}
+
+    # Duplicados exatos por ISBN
+    first_by_isbn: Dict[str, int] = {}
+    for index, isbn13 in enumerate(isbns):
+        if isbn13:
+            leader = first_by_isbn.setdefault(isbn13, index)
+            if leader != index:
+                uf.union(leader, index)
+                motivos[(leader, index)] = "isbn"
+
+    # Duplicados aproximados por título/autores
+    if signatures:
+        matrix = np.vstack(signatures)
+        for a, b in similar_pairs(matrix, threshold):
+            i, j = signed[a], signed[b]
+            uf.union(i, j)
+            motivos.setdefault((i, j), "similaridade")
+
+    groups: Dict[int, List[int]] = {}
+    group_motivos: Dict[int, Set[str]] = {}
+    for (i, j), motivo in motivos.items():
+        root = uf.find(i)
+        group_motivos.setdefault(root, set()).add(motivo)
+    for index in range(len(ids)):
+        root = uf.find(index)
+        if root in group_motivos:
+            groups.setdefault(root, []).append(index)
+
+    return [
+        {
+            "motivos": sorted(group_motivos[root]),
+            "livros": [
+                {"id": ids[i], "titulo": titulos[i], "autores": autores[i], "isbn13": isbns[i]}
+                for i in members
+            ],
+        }
+        for root, members in groups.items()
+    ]
+
+
+class DuplicateJob:
+    """Estado e progresso de uma execução da detecção de duplicados"""
+
+    def __init__(self, threshold: float):
+        self.id = uuid.uuid4().hex
+        self.status = "pendente"  # 'pendente', 'executando', 'concluido' ou 'falhou'
+        self.threshold = threshold
+        self.total = 0
+        self.processados = 0
+        self.grupos: Optional[List[dict]] = None
+        self.erro: Optional[str] = None
+        self.criado_em = datetime.now(timezone.utc)
+        self.finalizado_em: Optional[datetime] = None
+
+
+jobs: Dict[str, DuplicateJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def create_job(threshold: float) -> Optional[DuplicateJob]:
+    """Registra um novo job, ou retorna None se já houver um em andamento"""
+    with _jobs_lock:
+        if any(job.status in ("pendente", "executando") for job in jobs.values()):
+            return None
+        job = DuplicateJob(threshold)
+        jobs[job.id] = job
+        return job
+
+
+def run_job(job: DuplicateJob) -> None:
+    """Executa a detecção de duplicados sobre todo o acervo"""
+    job.status = "executando"
+    db = SessionLocal()
+    try:
+        job.grupos = find_duplicates(db, threshold=job.threshold, job=job)
+        job.status = "concluido"
+    except Exception as e:
+        job.status = "falhou"
+        job.erro = str(e)
+    finally:
+        db.close()
+        job.finalizado_em = datetime.now(timezone.utc)
@@ -0,0 +1,299 @@
+"""
+Enriquecimento de metadados (capa, sinopse, páginas e subtítulo) por ISBN
+
+Os livros com campos faltando são processados em lotes. Em cada lote as
+respostas já conhecidas vêm do cache persistente (tabela metadata_cache) e as
+demais são buscadas no provedor com concorrência limitada, limite de
+requisições por segundo e novas tentativas com backoff. Os resultados de cada
+lote são gravados com uma única atualização em massa.
+
+Respostas negativas (ISBN desconhecido pelo provedor) expiram depois de
+ENRICHMENT_NEGATIVE_TTL_DAYS dias, já que o provedor pode passar a conhecer o
+livro; as demais ficam no cache indefinidamente.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+ENRICHABLE_FIELDS = ("capa_url", "sinopse", "paginas", "subtitulo")
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class MetadataProvider:
+    """Provedor compatível com a API de volumes do Google Books
+
+    O cache é separado por provedor usando a URL base como chave, então
+    respostas de um servidor local de testes ou de outro serviço compatível
+    nunca são reaproveitadas para a URL padrão.
+    """
+
+    def __init__(self, base_url: str = "https://www.googleapis.com/books/v1/volumes"):
+        self.base_url = base_url
+        self.name = base_url.rstrip("/")
+
+    async def fetch(self, client: httpx.AsyncClient, isbn: str) -> Optional[dict]:
+        """Busca os metadados de um ISBN; retorna None se o provedor não o conhece"""
+        response = await client.get(self.base_url, params={"q": f"isbn:{isbn}"})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        items = response.json().get("items") or []
+        if not items:
+            return None
+
+        info = items[0].get("volumeInfo", {})
+        capa_url = (info.get("imageLinks") or {}).get("thumbnail")
+        return {
+            "capa_url": capa_url.replace("http://", "https://", 1) if capa_url else None,
+            "sinopse": info.get("description"),
+            "paginas": info.get("pageCount"),
+            "subtitulo": info.get("subtitle"),
+        }
+
+
+def provider_from_env() -> MetadataProvider:
+    """Cria o provedor configurado em METADATA_PROVIDER_URL"""
+    base_url = os.getenv("METADATA_PROVIDER_URL")
+    return MetadataProvider(base_url) if base_url else MetadataProvider()
+
+
+class RateLimiter:
+    """Garante um intervalo mínimo entre o início de requisições consecutivas"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class EnrichmentJob:
+    """Estado e progresso de uma execução do enriquecimento"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "pendente"  # 'pendente', 'executando', 'concluido' ou 'falhou'
+        self.total = 0
+        self.processados = 0
+        self.atualizados = 0
+        self.do_cache = 0
+        self.falhas = 0
+        self.erro: Optional[str] = None
+        self.criado_em = datetime.now(timezone.utc)
+        self.finalizado_em: Optional[datetime] = None
+
+
+jobs: Dict[str, EnrichmentJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def create_job() -> Optional[EnrichmentJob]:
+    """Registra um novo job, ou retorna None se já houver um em andamento"""
+    with _jobs_lock:
+        if any(job.status in ("pendente", "executando") for job in jobs.values()):
+            return None
+        job = EnrichmentJob()
+        jobs[job.id] = job
+        return job
+
+
+def _missing_fields(book: dict) -> List[str]:
+    return [field for field in ENRICHABLE_FIELDS if not book[field]]
+
+
+def _is_empty(field: str):
+    column = getattr(models.Book, field)
+    return or_(column.is_(None), column == (0 if field == "paginas" else ""))
+
+
+def load_pending_books(db: Session) -> List[dict]:
+    """Lista livros com ISBN e pelo menos um campo enriquecível vazio"""
+    rows = db.query(
+        models.Book.id, models.Book.isbn13_normalizado,
+        models.Book.capa_url, models.Book.sinopse, models.Book.paginas, models.Book.subtitulo
+    ).filter(
+        models.Book.isbn13_normalizado.isnot(None),
+        or_(*[_is_empty(field) for field in ENRICHABLE_FIELDS])
+    ).order_by(models.Book.id).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def load_cached(
+    db: Session, provider_name: str, isbns: List[str], negative_ttl: timedelta
+) -> Dict[str, Optional[dict]]:
+    """Busca no cache as respostas já conhecidas para os ISBNs do lote
+
+    Respostas negativas mais antigas que negative_ttl são ignoradas, para que
+    o ISBN seja consultado de novo.
+    """
+    expired_before = datetime.now(timezone.utc) - negative_ttl
+    rows = db.query(
+        models.MetadataCache.isbn, models.MetadataCache.dados, models.MetadataCache.buscado_em
+    ).filter(
+        models.MetadataCache.provedor == provider_name,
+        models.MetadataCache.isbn.in_(isbns)
+    ).all()
+    return {
+        isbn: dados for isbn, dados, buscado_em in rows
+        if dados is not None or buscado_em.replace(tzinfo=timezone.utc) >= expired_before
+    }
+
+
+def save_batch(db: Session, provider_name: str, fetched: Dict[str, Optional[dict]], updates: List[dict]) -> int:
+    """Grava as novas respostas no cache e os campos preenchidos em massa
+
+    Os livros do lote são relidos (com bloqueio de linha onde o banco suporta)
+    e só recebem os campos que continuam vazios, preservando o que o usuário
+    tenha preenchido durante o job. atualizado_em é mantido, como no backfill
+    de ISBN, para não alterar a ordenação da listagem. Retorna a quantidade de
+    livros atualizados.
+    """
+    now = datetime.now(timezone.utc)
+    # Respostas negativas expiradas são consultadas de novo e substituídas
+    db.query(models.MetadataCache).filter(
+        models.MetadataCache.provedor == provider_name,
+        models.MetadataCache.isbn.in_(list(fetched))
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.MetadataCache, [
+        {"isbn": isbn, "provedor": provider_name, "dados": dados, "buscado_em": now}
+        for isbn, dados in fetched.items()
+    ])
+
+    mappings = []
+    if updates:
+        current = {
+            row.id: row for row in db.query(
+                models.Book.id, models.Book.atualizado_em, *[getattr(models.Book, f) for f in ENRICHABLE_FIELDS]
+            ).filter(models.Book.id.in_([update["id"] for update in updates])).with_for_update()
+        }
+        for update in updates:
+            row = current.get(update["id"])
+            if row is None:
+                continue
+            values = {field: value for field, value in update.items() if field != "id" and not getattr(row, field)}
+            if values:
+                mappings.append({"id": row.id, "atualizado_em": row.atualizado_em, **values})
+        db.bulk_update_mappings(models.Book, mappings)
+    db.commit()
+    return len(mappings)
+
+
+def _run_in_session(func, *args):
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+
+async def fetch_with_retries(
+    client: httpx.AsyncClient,
+    provider: MetadataProvider,
+    isbn: str,
+    semaphore: asyncio.Semaphore,
+    limiter: RateLimiter,
+    max_retries: int,
+    backoff: float
+) -> Optional[dict]:
+    """Busca um ISBN respeitando concorrência e limite de taxa, com novas tentativas"""
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                await limiter.wait()
+                return await provider.fetch(client, isbn)
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt == max_retries:
+                raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def run_job(
+    job: EnrichmentJob,
+    provider: Optional[MetadataProvider] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    backoff: float = 0.5,
+    negative_ttl_days: Optional[float] = None
+) -> None:
+    """Executa o enriquecimento de todos os livros com campos faltando"""
+    provider = provider or provider_from_env()
+    batch_size = batch_size or int(os.getenv("ENRICHMENT_BATCH_SIZE", "50"))
+    concurrency = concurrency or int(os.getenv("ENRICHMENT_CONCURRENCY", "4"))
+    rate_limit = rate_limit if rate_limit is not None else float(os.getenv("ENRICHMENT_RATE_LIMIT", "5"))
+    max_retries = max_retries if max_retries is not None else int(os.getenv("ENRICHMENT_MAX_RETRIES", "3"))
+    if negative_ttl_days is None:
+        negative_ttl_days = float(os.getenv("ENRICHMENT_NEGATIVE_TTL_DAYS", "30"))
+    negative_ttl = timedelta(days=negative_ttl_days)
+
+    job.status = "executando"
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_limit)
+    try:
+        books = await asyncio.to_thread(_run_in_session, load_pending_books)
+        job.total = len(books)
+
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            for start in range(0, len(books), batch_size):
+                batch = books[start:start + batch_size]
+                isbns = sorted({book["isbn13_normalizado"] for book in batch})
+                known = await asyncio.to_thread(_run_in_session, load_cached, provider.name, isbns, negative_ttl)
+                missing = [isbn for isbn in isbns if isbn not in known]
+
+                results = await asyncio.gather(*[
+                    fetch_with_retries(client, provider, isbn, semaphore, limiter, max_retries, backoff)
+                    for isbn in missing
+                ], return_exceptions=True)
+                fetched = {
+                    isbn: result for isbn, result in zip(missing, results)
+                    if not isinstance(result, BaseException)
+                }
+                failed = {isbn for isbn, result in zip(missing, results) if isinstance(result, BaseException)}
+
+                updates = []
+                for book in batch:
+                    isbn = book["isbn13_normalizado"]
+                    if isbn in failed:
+                        job.falhas += 1
+                        continue
+                    if isbn in known:
+                        job.do_cache += 1
+                    dados = known.get(isbn) if isbn in known else fetched.get(isbn)
+                    values = {
+                        field: dados[field] for field in _missing_fields(book)
+                        if dados and dados.get(field)
+                    }
+                    if values:
+                        updates.append({"id": book["id"], **values})
+
+                job.atualizados += await asyncio.to_thread(
+                    _run_in_session, save_batch, provider.name, fetched, updates
+                )
+                job.processados += len(batch)
+
+        job.status = "concluido"
+    except Exception as e:
+        job.status = "falhou"
+        job.erro = str(e)
+    finally:
+        job.finalizado_em = datetime.now(timezone.utc)
@@ -0,0 +1,95 @@
+"""
+Normalização e conversão de ISBN-10/ISBN-13
+
+A normalização só remove separadores e confere o formato (quantidade de
+dígitos). O dígito verificador é conferido à parte, por is_valid_isbn10 e
+is_valid_isbn13: ISBNs importados com erro de digitação continuam
+normalizados para que a busca por ISBN e a detecção de duplicados os alcancem.
+"""
+import re
+from typing import Optional, Tuple
+
+_NON_ISBN_CHARS = re.compile(r"[^0-9X]")
+
+
+def clean_isbn(value: Optional[str]) -> Optional[str]:
+    """Remove hífens, espaços e demais separadores de um ISBN"""
+    if not value:
+        return None
+    cleaned = _NON_ISBN_CHARS.sub("", value.upper())
+    return cleaned or None
+
+
+def _isbn10_check_digit(digits: str) -> str:
+    total = sum((10 - i) * int(d) for i, d in enumerate(digits[:9]))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+
+def _isbn13_check_digit(digits: str) -> str:
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn10(value: Optional[str]) -> Optional[str]:
+    """Retorna o ISBN-10 sem separadores, ou None se não tiver o formato de ISBN-10"""
+    cleaned = clean_isbn(value)
+    if not cleaned or len(cleaned) != 10 or not cleaned[:9].isdigit():
+        return None
+    return cleaned
+
+
+def normalize_isbn13(value: Optional[str]) -> Optional[str]:
+    """Retorna o ISBN-13 sem separadores, ou None se não tiver o formato de ISBN-13"""
+    cleaned = clean_isbn(value)
+    if not cleaned or len(cleaned) != 13 or not cleaned.isdigit():
+        return None
+    return cleaned
+
+
+def is_valid_isbn10(value: Optional[str]) -> bool:
+    """Confere o formato e o dígito verificador de um ISBN-10"""
+    cleaned = normalize_isbn10(value)
+    return bool(cleaned) and cleaned[9] == _isbn10_check_digit(cleaned)
+
+
+def is_valid_isbn13(value: Optional[str]) -> bool:
+    """Confere o formato e o dígito verificador de um ISBN-13"""
+    cleaned = normalize_isbn13(value)
+    return bool(cleaned) and cleaned[12] == _isbn13_check_digit(cleaned)
+
+
+def isbn10_to_isbn13(isbn10: str) -> str:
+    """Converte um ISBN-10 normalizado para ISBN-13 (prefixo 978)
+
+    O dígito verificador é recalculado, então um ISBN-10 com verificador
+    errado converge para o mesmo ISBN-13 da forma correta.
+    """
+    base = "978" + isbn10[:9]
+    return base + _isbn13_check_digit(base)
+
+
+def isbn13_to_isbn10(isbn13: str) -> Optional[str]:
+    """Converte um ISBN-13 normalizado para ISBN-10 (apenas prefixo 978)"""
+    if not isbn13.startswith("978"):
+        return None
+    base = isbn13[3:12]
+    return base + _isbn10_check_digit(base)
+
+
+def canonical_isbn13(value: Optional[str]) -> Optional[str]:
+    """Normaliza um ISBN-10 ou ISBN-13 para a forma canônica ISBN-13"""
+    isbn13 = normalize_isbn13(value)
+    if isbn13:
+        return isbn13
+    isbn10 = normalize_isbn10(value)
+    if isbn10:
+        return isbn10_to_isbn13(isbn10)
+    return None
+
+
+def normalized_isbns(isbn10: Optional[str], isbn13: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Retorna (isbn10, isbn13) normalizados, derivando um do outro quando possível"""
+    canonical13 = canonical_isbn13(isbn13) or canonical_isbn13(isbn10)
+    canonical10 = normalize_isbn10(isbn10) or (isbn13_to_isbn10(canonical13) if canonical13 else None)
+    return canonical10, canonical13
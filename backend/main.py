@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
@@ -8,18 +9,40 @@ from dotenv import load_dotenv
 import models
 import schemas
 import crud
-from database import engine, get_db, init_db
+import duplicates
+import enrichment
+from similarity import similarity_index
+from suggest import suggest_index
+from database import SessionLocal, engine, get_db, init_db, upgrade_db
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 # Criar tabelas
 models.Base.metadata.create_all(bind=engine)
+upgrade_db()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Tarefas executadas na inicialização da API"""
+    db = SessionLocal()
+    try:
+        # Livros novos são normalizados ao salvar; o backfill roda a cada
+        # inicialização e só alcança livros ainda sem ISBN normalizado
+        crud.backfill_isbns(db)
+        similarity_index.build_from_db(db)
+        suggest_index.build_from_db(db)
+    finally:
+        db.close()
+    yield
+
 
 app = FastAPI(
     title="Biblioteca API",
     description="API REST para gerenciamento de biblioteca pessoal",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -58,6 +81,15 @@ def list_books(
     return books
 
 
+@app.get("/api/books/by-isbn/{isbn}", response_model=schemas.BookResponse, tags=["Books"])
+def get_book_by_isbn(isbn: str, db: Session = Depends(get_db)):
+    """Busca um livro por ISBN-10 ou ISBN-13"""
+    book = crud.get_book_by_isbn(db, isbn)
+    if not book:
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    return book
+
+
 @app.get("/api/books/{book_id}", response_model=schemas.BookResponse, tags=["Books"])
 def get_book(book_id: str, db: Session = Depends(get_db)):
     """Busca um livro por ID"""
@@ -70,12 +102,16 @@ def get_book(book_id: str, db: Session = Depends(get_db)):
 @app.post("/api/books", response_model=schemas.BookResponse, status_code=status.HTTP_201_CREATED, tags=["Books"])
 def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
     """Cria um novo livro"""
+    if crud.find_isbn_conflict(db, book.isbn10, book.isbn13):
+        raise HTTPException(status_code=409, detail="Já existe um livro com este ISBN")
     return crud.create_book(db, book)
 
 
 @app.put("/api/books/{book_id}", response_model=schemas.BookResponse, tags=["Books"])
 def update_book(book_id: str, book: schemas.BookUpdate, db: Session = Depends(get_db)):
     """Atualiza um livro existente"""
+    if crud.find_isbn_conflict(db, book.isbn10, book.isbn13, exclude_id=book_id):
+        raise HTTPException(status_code=409, detail="Já existe um livro com este ISBN")
     updated_book = crud.update_book(db, book_id, book)
     if not updated_book:
         raise HTTPException(status_code=404, detail="Livro não encontrado")
@@ -90,6 +126,18 @@ def delete_book(book_id: str, db: Session = Depends(get_db)):
     return None
 
 
+@app.get("/api/books/{book_id}/similar", response_model=List[schemas.SimilarBookResponse], tags=["Books"])
+def get_similar_books(
+    book_id: str,
+    k: int = Query(default=10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Lista os livros mais similares por tags, autores, editora e idioma"""
+    if book_id not in similarity_index and not crud.get_book(db, book_id):
+        raise HTTPException(status_code=404, detail="Livro não encontrado")
+    return crud.get_similar_books(db, book_id, k)
+
+
 @app.post("/api/books/{book_id}/favorite", response_model=schemas.BookResponse, tags=["Books"])
 def toggle_favorite(book_id: str, db: Session = Depends(get_db)):
     """Alterna status de favorito de um livro"""
@@ -99,6 +147,13 @@ def toggle_favorite(book_id: str, db: Session = Depends(get_db)):
     return book
 
 
+# Suggest Endpoint
+@app.get("/api/suggest", response_model=List[schemas.SuggestionResponse], tags=["Books"])
+def suggest(q: str = "", limit: int = Query(default=10, ge=1, le=50)):
+    """Sugere títulos, autores, editoras e tags para autocompletar a busca"""
+    return suggest_index.suggest(q, limit)
+
+
 # Loans Endpoints
 @app.post("/api/books/{book_id}/loan", response_model=schemas.BookResponse, tags=["Loans"])
 def create_loan(book_id: str, loan: schemas.LoanCreate, db: Session = Depends(get_db)):
@@ -143,6 +198,62 @@ def get_loan_history(book_id: str, db: Session = Depends(get_db)):
     return crud.get_loan_history(db, book_id)
 
 
+# Duplicates Endpoints
+@app.post(
+    "/api/duplicates/jobs",
+    response_model=schemas.DuplicateJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Duplicates"]
+)
+def start_duplicates(background_tasks: BackgroundTasks, threshold: float = Query(default=0.8, ge=0, le=1)):
+    """Inicia a detecção de duplicados por ISBN ou por título/autores similares"""
+    job = duplicates.create_job(threshold)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Já existe uma detecção de duplicados em andamento")
+    background_tasks.add_task(duplicates.run_job, job)
+    return job
+
+
+@app.get("/api/duplicates/jobs/{job_id}", response_model=schemas.DuplicateJobResponse, tags=["Duplicates"])
+def get_duplicates_job(job_id: str):
+    """Consulta o progresso de uma detecção de duplicados e, ao concluir, os grupos encontrados"""
+    job = duplicates.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
+# Enrichment Endpoints
+@app.post(
+    "/api/enrichment/jobs",
+    response_model=schemas.EnrichmentJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Enrichment"]
+)
+def start_enrichment(background_tasks: BackgroundTasks):
+    """Inicia o enriquecimento de metadados dos livros com campos faltando"""
+    job = enrichment.create_job()
+    if job is None:
+        raise HTTPException(status_code=409, detail="Já existe um enriquecimento em andamento")
+    background_tasks.add_task(enrichment.run_job, job)
+    return job
+
+
+@app.get("/api/enrichment/jobs", response_model=List[schemas.EnrichmentJobResponse], tags=["Enrichment"])
+def list_enrichment_jobs():
+    """Lista os jobs de enriquecimento desde a inicialização da API"""
+    return list(enrichment.jobs.values())
+
+
+@app.get("/api/enrichment/jobs/{job_id}", response_model=schemas.EnrichmentJobResponse, tags=["Enrichment"])
+def get_enrichment_job(job_id: str):
+    """Consulta o progresso de um job de enriquecimento"""
+    job = enrichment.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
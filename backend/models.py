@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, JSON, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
+from isbn import normalized_isbns
 
 
 class Book(Base):
@@ -19,6 +20,8 @@ class Book(Base):
     edicao = Column(String, nullable=True)
     isbn10 = Column(String, nullable=True)
     isbn13 = Column(String, nullable=True)
+    isbn10_normalizado = Column(String, nullable=True)  # Apenas dígitos, preenchido automaticamente
+    isbn13_normalizado = Column(String, nullable=True, index=True)  # ISBN-13 canônico, inclusive a partir do ISBN-10
     idioma = Column(String, nullable=False)
     tags = Column(JSON, nullable=False)  # Lista de strings
     sinopse = Column(Text, nullable=True)
@@ -38,6 +41,17 @@ class Book(Base):
                         overlaps="emprestimo_atual")
 
 
+def normalize_book_isbns(book: Book) -> None:
+    """Preenche as colunas normalizadas de ISBN a partir de isbn10/isbn13"""
+    book.isbn10_normalizado, book.isbn13_normalizado = normalized_isbns(book.isbn10, book.isbn13)
+
+
+@event.listens_for(Book, "before_insert")
+@event.listens_for(Book, "before_update")
+def _normalize_isbns_before_flush(mapper, connection, target):
+    normalize_book_isbns(target)
+
+
 class Loan(Base):
     __tablename__ = "loans"
 
@@ -67,3 +81,12 @@ class LoanHistory(Base):
 
     # Relacionamentos
     book = relationship("Book", back_populates="historico_emprestimos")
+
+
+class MetadataCache(Base):
+    __tablename__ = "metadata_cache"
+
+    isbn = Column(String, primary_key=True)  # ISBN-13 normalizado
+    provedor = Column(String, primary_key=True)
+    dados = Column(JSON, nullable=True)  # None quando o provedor não conhece o ISBN
+    buscado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
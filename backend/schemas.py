@@ -97,6 +97,67 @@ class BookResponse(BookBase):
         from_attributes = True
 
 
+# Similar Books Schema
+class SimilarBookResponse(BaseModel):
+    id: str
+    titulo: str
+    autores: List[str]
+    capa_url: Optional[str] = None
+    score: float
+
+
+# Suggestion Schema
+class SuggestionResponse(BaseModel):
+    texto: str
+    tipo: str  # 'titulo', 'autor', 'editora' ou 'tag'
+    livros: int
+
+
+# Duplicate Schemas
+class DuplicateBook(BaseModel):
+    id: str
+    titulo: str
+    autores: List[str]
+    isbn13: Optional[str] = None
+
+
+class DuplicateGroup(BaseModel):
+    motivos: List[str]  # 'isbn' e/ou 'similaridade'
+    livros: List[DuplicateBook]
+
+
+class DuplicateJobResponse(BaseModel):
+    id: str
+    status: str  # 'pendente', 'executando', 'concluido' ou 'falhou'
+    threshold: float
+    total: int
+    processados: int
+    grupos: Optional[List[DuplicateGroup]] = None  # preenchido ao concluir
+    erro: Optional[str] = None
+    criado_em: datetime
+    finalizado_em: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+# Enrichment Schemas
+class EnrichmentJobResponse(BaseModel):
+    id: str
+    status: str  # 'pendente', 'executando', 'concluido' ou 'falhou'
+    total: int
+    processados: int
+    atualizados: int
+    do_cache: int
+    falhas: int
+    erro: Optional[str] = None
+    criado_em: datetime
+    finalizado_em: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # Return Book Schema
 class ReturnBookRequest(BaseModel):
     data_devolucao: Optional[str] = None  # ISO date string, usa data atual se não fornecido
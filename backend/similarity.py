@@ -0,0 +1,295 @@
+"""
+Índice em memória de livros similares
+
+Cada livro vira uma linha de uma matriz esparsa com uma coluna por tag, autor,
+editora e idioma. A similaridade é o produto escalar entre linhas normalizadas,
+ponderado pelo IDF de cada atributo para que valores muito comuns (como o
+idioma) pesem menos que autores ou tags raros.
+
+A matriz é construída em lote na inicialização. Inclusões e alterações feitas
+pelo crud ficam em uma segunda matriz, pequena, só com as pendências, e
+exclusões apenas desativam a linha. Quando as pendências acumulam, a matriz
+principal é recompactada em segundo plano e trocada ao final.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+import models
+from duplicates import normalize_text
+
+FIELD_WEIGHTS = {
+    "autor": 1.5,
+    "tag": 1.0,
+    "editora": 0.5,
+    "idioma": 0.25,
+}
+COMPACT_THRESHOLD = 2048
+COMMON_FEATURE_RATIO = 0.1
+BATCH_SIZE = 10000
+
+BookRow = Tuple[str, Optional[Sequence[str]], Optional[Sequence[str]], Optional[str], Optional[str]]
+
+
+def book_features(
+    tags: Optional[Sequence[str]],
+    autores: Optional[Sequence[str]],
+    editora: Optional[str],
+    idioma: Optional[str]
+) -> Dict[str, float]:
+    """Extrai os atributos (com peso) usados na comparação entre livros"""
+    features: Dict[str, float] = {}
+    for field, values in (
+        ("autor", autores or []),
+        ("tag", tags or []),
+        ("editora", [editora] if editora else []),
+        ("idioma", [idioma] if idioma else []),
+    ):
+        for value in values:
+            normalized = normalize_text(value)
+            if normalized:
+                features[f"{field}:{normalized}"] = FIELD_WEIGHTS[field]
+    return features
+
+
+def _build_matrix(encoded: Sequence[Tuple[np.ndarray, np.ndarray]], n_cols: int) -> sparse.csc_matrix:
+    """Monta a matriz livro x atributo a partir das linhas codificadas"""
+    lengths = np.fromiter((len(cols) for cols, _ in encoded), dtype=np.int64, count=len(encoded))
+    indptr = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.concatenate([cols for cols, _ in encoded]) if encoded else np.zeros(0, dtype=np.int32)
+    data = np.concatenate([vals for _, vals in encoded]) if encoded else np.zeros(0, dtype=np.float32)
+    matrix = sparse.csr_matrix((data, indices, indptr), shape=(len(encoded), n_cols))
+    # CSC permite somar apenas as colunas dos atributos do livro consultado
+    return matrix.tocsc()
+
+
+class SimilarityIndex:
+    """Matriz esparsa livro x atributo com atualização incremental"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._vocab: Dict[str, int] = {}
+        self._df = np.zeros(0, dtype=np.int64)
+        self._features: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._matrix = sparse.csc_matrix((0, 0), dtype=np.float32)
+        self._row_ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._pending: Dict[str, None] = {}
+        self._pending_ids: List[str] = []
+        self._pending_matrix = sparse.csc_matrix((0, 0), dtype=np.float32)
+        self._compaction: Optional[threading.Thread] = None
+        self._changed_during_compaction: Optional[set] = None
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def __contains__(self, book_id: str) -> bool:
+        return book_id in self._features
+
+    def _encode(self, features: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        cols = np.empty(len(features), dtype=np.int32)
+        vals = np.empty(len(features), dtype=np.float32)
+        for i, (name, weight) in enumerate(features.items()):
+            col = self._vocab.get(name)
+            if col is None:
+                col = self._vocab[name] = len(self._vocab)
+            cols[i] = col
+            vals[i] = weight
+        norm = np.sqrt(np.dot(vals, vals))
+        if norm:
+            vals /= norm
+        return cols, vals
+
+    def _grow_df(self) -> None:
+        if len(self._df) < len(self._vocab):
+            grown = np.zeros(max(len(self._vocab), 2 * len(self._df)), dtype=np.int64)
+            grown[:len(self._df)] = self._df
+            self._df = grown
+
+    def build(self, rows: Iterable[BookRow]) -> None:
+        """Reconstrói o índice inteiro a partir de (id, tags, autores, editora, idioma)"""
+        self.wait_for_compaction()
+        with self._lock:
+            self._vocab = {}
+            self._features = {}
+            for book_id, tags, autores, editora, idioma in rows:
+                self._features[book_id] = self._encode(book_features(tags, autores, editora, idioma))
+            self._df = np.zeros(len(self._vocab), dtype=np.int64)
+            for cols, _ in self._features.values():
+                self._df[cols] += 1
+            self._compact()
+
+    def build_from_db(self, db: Session) -> None:
+        """Reconstrói o índice a partir de todos os livros do banco"""
+        query = db.query(
+            models.Book.id, models.Book.tags, models.Book.autores, models.Book.editora, models.Book.idioma
+        ).yield_per(BATCH_SIZE)
+        self.build(query)
+
+    def _compact(self) -> None:
+        """Reconstrói a matriz principal de forma síncrona (usado na carga inicial)"""
+        row_ids = list(self._features)
+        self._install_base(row_ids, _build_matrix([self._features[i] for i in row_ids], len(self._vocab)))
+        self._pending = {}
+        self._rebuild_pending()
+
+    def _install_base(self, row_ids: List[str], matrix: sparse.csc_matrix) -> None:
+        self._row_ids = row_ids
+        self._row_of = {book_id: row for row, book_id in enumerate(row_ids)}
+        self._matrix = matrix
+        self._alive = np.ones(len(row_ids), dtype=bool)
+
+    def _rebuild_pending(self) -> None:
+        # Matriz pequena só com as pendências, refeita a cada alteração
+        self._pending_ids = list(self._pending)
+        self._pending_matrix = _build_matrix(
+            [self._features[book_id] for book_id in self._pending_ids], len(self._vocab)
+        )
+
+    def _start_compaction(self) -> None:
+        """Recompacta em segundo plano a partir de um retrato das linhas atuais
+
+        A matriz nova é montada fora do lock; enquanto isso as consultas seguem
+        usando a matriz antiga mais as pendências. Os livros alterados durante a
+        montagem continuam pendentes após a troca.
+        """
+        if self._compaction is not None:
+            return
+        snapshot = list(self._features.items())
+        n_cols = len(self._vocab)
+        self._changed_during_compaction = set()
+
+        def run():
+            try:
+                row_ids = [book_id for book_id, _ in snapshot]
+                matrix = _build_matrix([encoded for _, encoded in snapshot], n_cols)
+            except Exception:
+                with self._lock:
+                    self._changed_during_compaction = None
+                    self._compaction = None
+                raise
+            with self._lock:
+                changed = self._changed_during_compaction
+                self._install_base(row_ids, matrix)
+                for book_id in changed:
+                    row = self._row_of.get(book_id)
+                    if row is not None:
+                        self._alive[row] = False
+                self._pending = {book_id: None for book_id in changed if book_id in self._features}
+                self._rebuild_pending()
+                self._changed_during_compaction = None
+                self._compaction = None
+
+        self._compaction = threading.Thread(target=run, name="similarity-compaction", daemon=True)
+        self._compaction.start()
+
+    def wait_for_compaction(self) -> None:
+        """Aguarda a recompactação em segundo plano, se houver uma em andamento"""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def add(self, book: models.Book) -> None:
+        """Inclui ou substitui um livro no índice"""
+        with self._lock:
+            self._discard(book.id)
+            cols, vals = self._encode(book_features(book.tags, book.autores, book.editora, book.idioma))
+            self._grow_df()
+            self._df[cols] += 1
+            self._features[book.id] = (cols, vals)
+            self._pending[book.id] = None
+            if self._changed_during_compaction is not None:
+                self._changed_during_compaction.add(book.id)
+            self._rebuild_pending()
+            if len(self._pending) >= COMPACT_THRESHOLD:
+                self._start_compaction()
+
+    def remove(self, book_id: str) -> None:
+        """Remove um livro do índice"""
+        with self._lock:
+            if self._discard(book_id):
+                self._rebuild_pending()
+
+    def _discard(self, book_id: str) -> bool:
+        encoded = self._features.pop(book_id, None)
+        if encoded is None:
+            return False
+        self._df[encoded[0]] -= 1
+        self._pending.pop(book_id, None)
+        if self._changed_during_compaction is not None:
+            self._changed_during_compaction.add(book_id)
+        row = self._row_of.get(book_id)
+        if row is not None:
+            self._alive[row] = False
+        return True
+
+    def _column(self, col: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self._matrix.indptr[col], self._matrix.indptr[col + 1]
+        return self._matrix.indices[start:end], self._matrix.data[start:end]
+
+    def _score_base(self, cols: np.ndarray, weights: np.ndarray, common: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if common.all():
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        gathered = [self._column(c) for c in cols[~common]]
+        all_rows = np.concatenate([rows for rows, _ in gathered])
+        all_scores = np.concatenate([data * w for (_, data), w in zip(gathered, weights[~common])])
+        rows, inverse = np.unique(all_rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=all_scores, minlength=len(rows))
+
+        for col, weight in zip(cols[common], weights[common]):
+            col_rows, col_data = self._column(col)
+            pos = np.searchsorted(col_rows, rows)
+            pos[pos == len(col_rows)] = 0
+            hit = col_rows[pos] == rows if len(col_rows) else np.zeros(len(rows), dtype=bool)
+            scores[hit] += col_data[pos[hit]] * weight
+        return rows, scores
+
+    def similar(self, book_id: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Retorna até k pares (id, score) dos livros mais similares"""
+        with self._lock:
+            encoded = self._features.get(book_id)
+            if encoded is None or k <= 0:
+                return []
+            cols, vals = encoded
+            idf = np.log((1 + len(self._features)) / (1 + self._df[cols])) + 1
+            weights = vals * idf
+
+            # Candidatos vêm apenas dos atributos seletivos; atributos presentes em
+            # grande parte do acervo (como o idioma) só somam pontos a esses
+            # candidatos. A regra vale igual para a matriz principal e para as
+            # pendências, então o resultado não depende de já ter havido compactação.
+            common = self._df[cols] > COMMON_FEATURE_RATIO * len(self._features)
+            if common.all():
+                common[:] = False
+
+            results: List[Tuple[str, float]] = []
+            base = cols < self._matrix.shape[1]
+            if base.any():
+                rows, scores = self._score_base(cols[base], weights[base], common[base])
+                keep = self._alive[rows] & (rows != self._row_of.get(book_id, -1))
+                rows, scores = rows[keep], scores[keep]
+                if len(rows) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    rows, scores = rows[top], scores[top]
+                results.extend((self._row_ids[r], float(s)) for r, s in zip(rows, scores))
+
+            if self._pending_ids:
+                pending = self._pending_matrix[:, cols]
+                scores = pending @ weights
+                rows = np.flatnonzero(pending @ np.where(common, 0, weights) > 0)
+                if len(rows) > k + 1:
+                    rows = rows[np.argpartition(-scores[rows], k)[:k + 1]]
+                results.extend(
+                    (self._pending_ids[r], float(scores[r])) for r in rows if self._pending_ids[r] != book_id
+                )
+
+            results.sort(key=lambda item: (-item[1], item[0]))
+            return results[:k]
+
+
+similarity_index = SimilarityIndex()
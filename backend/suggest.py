@@ -0,0 +1,423 @@
+"""
+Índice em memória para autocompletar títulos, autores, editoras e tags
+
+Cada termo distinto é guardado uma única vez, com a quantidade de livros que o
+usam. As chaves de busca (o termo normalizado a partir do início de cada uma
+das primeiras palavras) ficam em um array NumPy ordenado, consultado por busca
+binária. O tamanho das chaves e o número de palavras indexadas por termo são
+limitados para manter a memória proporcional ao acervo.
+
+Faixas de prefixo pequenas são percorridas inteiras e ordenadas na consulta.
+Para prefixos curtos, cuja faixa é grande, os termos mais usados são
+pré-calculados na compactação; a ordem entre eles usa as contagens atuais, mas
+um termo que cresceu muito desde a última compactação só entra nessa lista na
+próxima.
+
+Termos novos vão para arrays ordenados de pendências, dos quais cada consulta
+aproveita no máximo TOP_N termos, e termos que deixam de ser usados ficam com
+contagem zero. Quando esses acumulam, a compactação roda em segundo plano
+sobre um retrato do índice e os arrays novos são trocados de uma vez ao final,
+sem bloquear as consultas durante a montagem. Os ids de termos cujas chaves
+saíram dos arrays são reaproveitados, então termos existentes nunca mudam de id.
+
+As chaves usam o texto normalizado de duplicates.normalize_text, só com ASCII:
+termos escritos apenas em alfabetos não latinos não são sugeridos.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from duplicates import normalize_text
+
+MAX_KEY_LENGTH = 32
+MAX_WORD_KEYS = 4
+SCAN_LIMIT = 512
+TOP_N = 64
+COMPACT_THRESHOLD = 50000
+BATCH_SIZE = 10000
+MERGE_CHUNK = 1 << 16
+
+KEY_DTYPE = f"S{MAX_KEY_LENGTH}"
+# Maior que qualquer caractere de uma chave normalizada ([a-z0-9 ])
+_PREFIX_END = "\x7f"
+
+SuggestRow = Tuple[Optional[str], Optional[Sequence[str]], Optional[str], Optional[Sequence[str]]]
+Term = Tuple[str, str]
+
+
+def book_terms(
+    titulo: Optional[str],
+    autores: Optional[Sequence[str]],
+    editora: Optional[str],
+    tags: Optional[Sequence[str]]
+) -> List[Term]:
+    """Lista os pares (tipo, texto) sugeridos a partir de um livro"""
+    terms = []
+    for kind, values in (
+        ("titulo", [titulo] if titulo else []),
+        ("autor", autores or []),
+        ("editora", [editora] if editora else []),
+        ("tag", tags or []),
+    ):
+        for value in values:
+            # Sem nenhum caractere indexável o termo não teria chaves
+            if value and normalize_text(value):
+                terms.append((kind, value.strip()))
+    return terms
+
+
+def book_terms_of(book: models.Book) -> List[Term]:
+    """Termos de um livro; capture-os antes de alterar ou excluir o livro"""
+    return book_terms(book.titulo, book.autores, book.editora, book.tags)
+
+
+def term_keys(normalized: str) -> List[str]:
+    """Chaves de prefixo de um termo: o texto a partir de cada uma das primeiras palavras"""
+    keys = []
+    position = 0
+    while position < len(normalized) and len(keys) < MAX_WORD_KEYS:
+        keys.append(normalized[position:position + MAX_KEY_LENGTH])
+        next_space = normalized.find(" ", position)
+        if next_space < 0:
+            break
+        position = next_space + 1
+    return keys
+
+
+def _yield_gil() -> None:
+    # Os laços da compactação rodam em segundo plano; sem ceder o GIL a cada
+    # passo, uma consulta esperaria o intervalo de troca do interpretador (5 ms)
+    time.sleep(0)
+
+
+def _best_terms(terms: np.ndarray, rank: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Termos distintos de maior relevância (com a relevância) em ordem decrescente
+
+    Um termo tem no máximo MAX_WORD_KEYS chaves na faixa, então
+    MAX_WORD_KEYS * limit chaves bastam para encontrar limit termos distintos.
+    """
+    size = min(len(terms), MAX_WORD_KEYS * limit)
+    if size == 0:
+        return terms[:0], rank[:0]
+    best = np.argpartition(-rank, size - 1)[:size]
+    best = best[np.argsort(-rank[best], kind="stable")]
+    _, first_seen = np.unique(terms[best], return_index=True)
+    best = best[np.sort(first_seen)][:limit]
+    return terms[best], rank[best]
+
+
+def _rank(first: np.ndarray, terms: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # Mesma ordem da consulta: primeiro termos que começam com o prefixo
+    # (chave da primeira palavra), depois os usados por mais livros
+    return (first.astype(np.int64) << 40) | counts[terms]
+
+
+def _top_terms(keys: np.ndarray, terms: np.ndarray, first: np.ndarray, counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Pré-calcula os termos mais relevantes de cada prefixo com faixa maior que SCAN_LIMIT
+
+    A lista de um prefixo sai das listas dos prefixos um caractere mais longos
+    (mais as chaves iguais ao próprio prefixo): um termo entre os TOP_N do
+    prefixo está entre os TOP_N da faixa que contém sua chave mais relevante.
+    Assim nenhuma operação percorre as faixas grandes inteiras.
+    """
+    top: Dict[str, np.ndarray] = {}
+
+    def walk(prefix: bytes, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+        if hi - lo <= SCAN_LIMIT:
+            return terms[lo:hi], _rank(first[lo:hi], terms[lo:hi], counts)
+        _yield_gil()
+
+        # Chaves iguais ao próprio prefixo vêm primeiro; depois, uma faixa por caractere seguinte
+        j = lo + int(np.searchsorted(keys[lo:hi], prefix, side="right"))
+        parts = [_best_terms(terms[lo:j], _rank(first[lo:j], terms[lo:j], counts), TOP_N)]
+        while j < hi:
+            child = bytes(keys[j][:len(prefix) + 1])
+            end = j + int(np.searchsorted(keys[j:hi], child + _PREFIX_END.encode("ascii"), side="left"))
+            parts.append(walk(child, j, end))
+            j = end
+
+        best, rank = _best_terms(
+            np.concatenate([part_terms for part_terms, _ in parts]),
+            np.concatenate([part_rank for _, part_rank in parts]),
+            TOP_N
+        )
+        if prefix:
+            top[prefix.decode("ascii")] = best
+        return best, rank
+
+    walk(b"", 0, len(keys))
+    return top
+
+
+def _merge_keys(keys, terms, first, extra_keys, extra_terms, extra_first):
+    """Insere chaves (com termo e marcação de primeira palavra) mantendo a ordem
+
+    Os arrays novos são preenchidos em blocos, com np.take sobre arrays de
+    índices, que o NumPy executa sem segurar o GIL. Cópias inteiras e máscaras
+    booleanas sobre milhões de chaves seguram o GIL por dezenas de ms e
+    atrasariam as consultas durante a compactação.
+    """
+    order = np.argsort(extra_keys, kind="stable")
+    extra_keys, extra_terms, extra_first = extra_keys[order], extra_terms[order], extra_first[order]
+    extra_at = np.searchsorted(keys, extra_keys, side="right") + np.arange(len(order))
+
+    total = len(keys) + len(order)
+    merged = (np.empty(total, dtype=KEY_DTYPE), np.empty(total, dtype=np.int32), np.empty(total, dtype=bool))
+    for start in range(0, total, MERGE_CHUNK):
+        _yield_gil()
+        stop = min(start + MERGE_CHUNK, total)
+        positions = np.arange(start, stop)
+        before = int(np.searchsorted(extra_at, start))
+        source = positions - before - np.searchsorted(extra_at[before:], positions)
+        for array, out in zip((keys, terms, first), merged):
+            if len(array):
+                np.take(array, source, out=out[start:stop], mode="clip")
+    for out, extra in zip(merged, (extra_keys, extra_terms, extra_first)):
+        out[extra_at] = extra
+    return merged
+
+
+def _compact(counts, keys, key_terms, key_first, pending_keys, pending_terms, pending_first):
+    """Remove as chaves de termos sem livros e incorpora as pendências
+
+    Trabalha só com arrays NumPy de um retrato do índice, então roda fora do lock.
+    """
+    keep = np.flatnonzero(counts[key_terms] > 0)
+    extra = counts[pending_terms] > 0
+    keys, key_terms, key_first = _merge_keys(
+        keys[keep], key_terms[keep], key_first[keep],
+        pending_keys[extra], pending_terms[extra], pending_first[extra]
+    )
+    return keys, key_terms, key_first, _top_terms(keys, key_terms, key_first, counts)
+
+
+def _empty_keys() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return np.zeros(0, dtype=KEY_DTYPE), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=bool)
+
+
+class SuggestIndex:
+    """Arrays ordenados de prefixos com contagem de uso por termo"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._kinds: List[str] = []
+        self._texts: List[str] = []
+        self._normalized: List[str] = []
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._term_of: Dict[Term, int] = {}
+        self._free: List[int] = []
+        self._dead: set = set()
+        self._keys, self._key_terms, self._key_first = _empty_keys()
+        self._top: Dict[str, np.ndarray] = {}
+        self._pending_keys, self._pending_terms, self._pending_first = _empty_keys()
+        self._compaction: Optional[threading.Thread] = None
+        self._added_during_compaction: Optional[set] = None
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._counts))
+
+    def _term_id(self, kind: str, text: str) -> Tuple[int, bool]:
+        normalized = normalize_text(text)
+        key = (kind, normalized)
+        term = self._term_of.get(key)
+        if term is not None:
+            return term, False
+        if self._free:
+            # Reaproveita o id de um termo cujas chaves já saíram dos arrays
+            term = self._free.pop()
+            self._kinds[term], self._texts[term], self._normalized[term] = kind, text, normalized
+        else:
+            term = len(self._texts)
+            self._kinds.append(kind)
+            self._texts.append(text)
+            self._normalized.append(normalized)
+            if term >= len(self._counts):
+                grown = np.zeros(max(1024, 2 * len(self._counts)), dtype=np.int64)
+                grown[:len(self._counts)] = self._counts
+                self._counts = grown
+        self._term_of[key] = term
+        return term, True
+
+    def build(self, rows: Iterable[SuggestRow]) -> None:
+        """Reconstrói o índice a partir de (titulo, autores, editora, tags)"""
+        self.wait_for_compaction()
+        with self._lock:
+            self._kinds, self._texts, self._normalized = [], [], []
+            self._counts = np.zeros(0, dtype=np.int64)
+            self._term_of = {}
+            self._free, self._dead = [], set()
+            counts: List[int] = []
+            for titulo, autores, editora, tags in rows:
+                for kind, text in book_terms(titulo, autores, editora, tags):
+                    term, created = self._term_id(kind, text)
+                    if created:
+                        counts.append(0)
+                    counts[term] += 1
+            self._counts = np.array(counts, dtype=np.int64)
+
+            keys, terms, first = [], [], []
+            for term, norm in enumerate(self._normalized):
+                for position, key in enumerate(term_keys(norm)):
+                    keys.append(key)
+                    terms.append(term)
+                    first.append(position == 0)
+            self._keys, self._key_terms, self._key_first = _merge_keys(
+                *_empty_keys(),
+                np.array(keys, dtype=KEY_DTYPE), np.array(terms, dtype=np.int32), np.array(first, dtype=bool)
+            )
+            self._top = _top_terms(self._keys, self._key_terms, self._key_first, self._counts)
+            self._pending_keys, self._pending_terms, self._pending_first = _empty_keys()
+
+    def build_from_db(self, db: Session) -> None:
+        """Reconstrói o índice a partir de todos os livros do banco"""
+        query = db.query(
+            models.Book.titulo, models.Book.autores, models.Book.editora, models.Book.tags
+        ).yield_per(BATCH_SIZE)
+        self.build(query)
+
+    def _insert_pending(self, term: int) -> None:
+        # As pendências são pequenas: inserir direto é mais barato que _merge_keys
+        keys = np.array(term_keys(self._normalized[term]), dtype=KEY_DTYPE)
+        order = np.argsort(keys, kind="stable")
+        positions = np.searchsorted(self._pending_keys, keys[order], side="right")
+        self._pending_keys = np.insert(self._pending_keys, positions, keys[order])
+        self._pending_terms = np.insert(self._pending_terms, positions, term)
+        self._pending_first = np.insert(self._pending_first, positions, order == 0)
+
+    def add(self, book: models.Book) -> None:
+        """Contabiliza os termos de um livro novo ou atualizado"""
+        self.add_terms(book_terms_of(book))
+
+    def add_terms(self, terms: Sequence[Term]) -> None:
+        """Contabiliza termos capturados com book_terms_of"""
+        with self._lock:
+            for kind, text in terms:
+                term, created = self._term_id(kind, text)
+                if created:
+                    self._insert_pending(term)
+                if self._counts[term] == 0:
+                    self._dead.discard(term)
+                    if self._added_during_compaction is not None:
+                        self._added_during_compaction.add(term)
+                self._counts[term] += 1
+            if len(self._pending_keys) >= COMPACT_THRESHOLD or len(self._dead) >= COMPACT_THRESHOLD:
+                self._start_compaction()
+
+    def remove_terms(self, terms: Sequence[Term]) -> None:
+        """Descontabiliza termos capturados com book_terms_of antes da alteração"""
+        with self._lock:
+            for kind, text in terms:
+                term = self._term_of.get((kind, normalize_text(text)))
+                if term is None or self._counts[term] == 0:
+                    continue
+                self._counts[term] -= 1
+                if self._counts[term] == 0:
+                    self._dead.add(term)
+            if len(self._dead) >= COMPACT_THRESHOLD:
+                self._start_compaction()
+
+    def _start_compaction(self) -> None:
+        if self._compaction is not None:
+            return
+        counts = self._counts[:len(self._texts)].copy()
+        dead = set(self._dead)
+        # Os arrays são sempre substituídos, nunca alterados, então basta guardar as referências
+        snapshot = (
+            counts, self._keys, self._key_terms, self._key_first,
+            self._pending_keys, self._pending_terms, self._pending_first,
+        )
+        self._added_during_compaction = set()
+
+        def run():
+            try:
+                compacted = _compact(*snapshot)
+            except Exception:
+                with self._lock:
+                    self._added_during_compaction = None
+                    self._compaction = None
+                raise
+            with self._lock:
+                self._install(compacted, counts, dead)
+
+        self._compaction = threading.Thread(target=run, name="suggest-compaction", daemon=True)
+        self._compaction.start()
+
+    def _install(self, compacted, counts: np.ndarray, dead: set) -> None:
+        """Troca os arrays pelos compactados, reaplicando o que mudou durante a montagem"""
+        self._keys, self._key_terms, self._key_first, self._top = compacted
+        self._pending_keys, self._pending_terms, self._pending_first = _empty_keys()
+
+        # Termos criados ou reativados durante a montagem não têm chaves nos
+        # arrays novos: voltam como pendentes se ainda têm livros
+        freed = dead & self._dead
+        for term in sorted(self._added_during_compaction):
+            if term < len(counts) and counts[term] > 0:
+                continue
+            if self._counts[term] > 0:
+                self._insert_pending(term)
+            else:
+                freed.add(term)
+
+        # Os demais termos sem chaves e sem livros têm os ids liberados
+        for term in sorted(freed):
+            del self._term_of[(self._kinds[term], self._normalized[term])]
+            self._texts[term] = self._normalized[term] = ""
+            self._free.append(term)
+        self._dead -= freed
+
+        self._added_during_compaction = None
+        self._compaction = None
+
+    def wait_for_compaction(self) -> None:
+        """Aguarda a compactação em segundo plano, se houver uma em andamento"""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def _candidates(self, prefix: str) -> Iterable[int]:
+        encoded = prefix.encode("ascii")
+        end = encoded + _PREFIX_END.encode("ascii")
+        lo = int(np.searchsorted(self._keys, encoded, side="left"))
+        hi = int(np.searchsorted(self._keys, end, side="left"))
+        if hi - lo > SCAN_LIMIT and prefix in self._top:
+            candidates = set(self._top[prefix].tolist())
+        else:
+            candidates = set(self._key_terms[lo:hi].tolist())
+
+        # Das pendências entram no máximo TOP_N termos, escolhidos em NumPy com
+        # a mesma relevância das listas pré-calculadas
+        lo = int(np.searchsorted(self._pending_keys, encoded, side="left"))
+        hi = int(np.searchsorted(self._pending_keys, end, side="left"))
+        terms = self._pending_terms[lo:hi]
+        if hi - lo > TOP_N:
+            terms, _ = _best_terms(terms, _rank(self._pending_first[lo:hi], terms, self._counts), TOP_N)
+        candidates.update(terms.tolist())
+        return candidates
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        """Sugere termos cujo início (ou de uma das primeiras palavras) casa com a consulta"""
+        normalized = normalize_text(query)
+        if not normalized or limit <= 0:
+            return []
+        prefix = normalized[:MAX_KEY_LENGTH]
+
+        with self._lock:
+            ranked = []
+            for term in self._candidates(prefix):
+                count = int(self._counts[term])
+                norm = self._normalized[term]
+                if count == 0 or (len(normalized) > MAX_KEY_LENGTH and normalized not in norm):
+                    continue
+                ranked.append((0 if norm.startswith(normalized) else 1, -count, norm, term))
+            ranked.sort()
+            return [
+                {"texto": self._texts[term], "tipo": self._kinds[term], "livros": -count}
+                for _, count, _, term in ranked[:limit]
+            ]
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+# O banco de testes precisa ser configurado antes de importar database.py
+_db_dir = tempfile.mkdtemp(prefix="biblioteca-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+import models  # noqa: E402,F401
+
+
+@pytest.fixture
+def db():
+    """Banco SQLite vazio a cada teste"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import duplicates
+import models
+
+
+@pytest.fixture(autouse=True)
+def clear_jobs():
+    yield
+    duplicates.jobs.clear()
+
+
+def add_book(db, book_id: str, titulo: str, autores, **fields) -> None:
+    values = {"editora": "Editora", "paginas": 100, "formato": "fisico", "idioma": "Português", "tags": []}
+    values.update(fields)
+    db.add(models.Book(id=book_id, titulo=titulo, autores=autores, **values))
+    db.commit()
+
+
+def group_ids(groups):
+    return sorted(sorted(book["id"] for book in group["livros"]) for group in groups)
+
+
+def test_groups_by_isbn_and_similar_title(db):
+    add_book(db, "1", "Clean Code", ["Robert C. Martin"], isbn13="9780132350884")
+    add_book(db, "2", "Código Limpo", ["Robert Martin"], isbn10="0132350882")
+    add_book(db, "3", "O Senhor dos Anéis: A Sociedade do Anel", ["J. R. R. Tolkien"])
+    add_book(db, "4", "O Senhor dos Aneis - A Sociedade do Anel", ["J.R.R. Tolkien"])
+    add_book(db, "5", "Dom Casmurro", ["Machado de Assis"])
+
+    groups = duplicates.find_duplicates(db, threshold=0.8)
+
+    assert group_ids(groups) == [["1", "2"], ["3", "4"]]
+    motivos = {tuple(sorted(b["id"] for b in g["livros"])): g["motivos"] for g in groups}
+    assert motivos[("1", "2")] == ["isbn"]
+    assert motivos[("3", "4")] == ["similaridade"]
+
+
+def test_similar_pairs_compares_whole_small_buckets():
+    # Os três livros caem no mesmo balde da primeira banda, mas só 1 e 2 são
+    # similares; o primeiro elemento do balde não é similar a nenhum deles
+    signatures = np.zeros((3, duplicates.NUM_PERM), dtype=np.uint32)
+    signatures[0] = np.arange(duplicates.NUM_PERM)
+    signatures[1] = np.arange(100, 100 + duplicates.NUM_PERM)
+    signatures[2] = signatures[1]
+    signatures[2][-1] = 7
+    signatures[1:, :duplicates.ROWS_PER_BAND] = signatures[0, :duplicates.ROWS_PER_BAND]
+
+    assert duplicates.similar_pairs(signatures, threshold=0.8) == [(1, 2)]
+
+
+def test_job_reports_progress_and_groups(db):
+    add_book(db, "1", "Clean Code", ["Robert C. Martin"], isbn13="9780132350884")
+    add_book(db, "2", "Clean Code", ["Robert C. Martin"])
+    add_book(db, "3", "Dom Casmurro", ["Machado de Assis"])
+
+    job = duplicates.create_job(threshold=0.8)
+    assert duplicates.create_job(threshold=0.5) is None
+    duplicates.run_job(job)
+
+    assert job.status == "concluido"
+    assert (job.total, job.processados) == (3, 3)
+    assert group_ids(job.grupos) == [["1", "2"]]
+    assert duplicates.create_job(threshold=0.5) is not None
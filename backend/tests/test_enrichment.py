@@ -0,0 +1,328 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+import enrichment
+import models
+
+ISBN_A = "9780132350884"
+ISBN_B = "9780201633610"
+ISBN_C = "9780735211292"
+UPDATED_AT = datetime(2024, 1, 15, 10, 0, 0)
+
+
+class StandInProvider:
+    """Servidor HTTP local que imita a API de volumes do Google Books"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.volumes = {}
+        self.failures = {}  # isbn -> lista de status a devolver antes de responder
+        self.hits = []
+        self.starts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/volumes"
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                isbn = parse_qs(urlparse(self.path).query)["q"][0].removeprefix("isbn:")
+                with provider._lock:
+                    provider.hits.append(isbn)
+                    provider.starts.append(time.monotonic())
+                    provider.in_flight += 1
+                    provider.max_in_flight = max(provider.max_in_flight, provider.in_flight)
+                    pending = provider.failures.get(isbn)
+                    status = pending.pop(0) if pending else 200
+                try:
+                    time.sleep(provider.delay)
+                    if status != 200:
+                        self.send_response(status)
+                        self.end_headers()
+                        return
+                    volume = provider.volumes.get(isbn)
+                    body = json.dumps({"items": [{"volumeInfo": volume}]} if volume else {"totalItems": 0})
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.end_headers()
+                    self.wfile.write(body.encode())
+                finally:
+                    with provider._lock:
+                        provider.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def clear_jobs():
+    yield
+    enrichment.jobs.clear()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    with StandInProvider() as stand_in:
+        monkeypatch.setenv("METADATA_PROVIDER_URL", stand_in.url)
+        yield stand_in
+
+
+def volume(isbn: str, **overrides) -> dict:
+    data = {
+        "subtitle": f"Subtítulo {isbn}",
+        "description": f"Sinopse {isbn}",
+        "pageCount": 300,
+        "imageLinks": {"thumbnail": f"http://covers.example/{isbn}.jpg"},
+    }
+    data.update(overrides)
+    return {key: value for key, value in data.items() if value is not None}
+
+
+def add_book(db, book_id: str, isbn13: str, **fields) -> models.Book:
+    values = {
+        "titulo": f"Livro {book_id}",
+        "autores": ["Autor"],
+        "editora": "Editora",
+        "paginas": 0,
+        "formato": "fisico",
+        "idioma": "Português",
+        "tags": [],
+        "criado_em": UPDATED_AT,
+        "atualizado_em": UPDATED_AT,
+    }
+    values.update(fields)
+    book = models.Book(id=book_id, isbn13=isbn13, **values)
+    db.add(book)
+    db.commit()
+    return book
+
+
+def run(job=None, **options) -> enrichment.EnrichmentJob:
+    job = job or enrichment.create_job()
+    options.setdefault("rate_limit", 0)
+    options.setdefault("backoff", 0.01)
+    asyncio.run(enrichment.run_job(job, **options))
+    return job
+
+
+def reload(db, book_id: str) -> models.Book:
+    db.expire_all()
+    return db.get(models.Book, book_id)
+
+
+def test_retries_transient_errors_until_success(db, provider):
+    add_book(db, "1", ISBN_A)
+    add_book(db, "2", ISBN_B)
+    provider.volumes = {ISBN_A: volume(ISBN_A), ISBN_B: volume(ISBN_B)}
+    provider.failures = {ISBN_A: [503], ISBN_B: [429, 503]}
+
+    job = run(max_retries=3)
+
+    assert job.status == "concluido"
+    assert job.falhas == 0
+    assert job.atualizados == 2
+    assert provider.hits.count(ISBN_A) == 2
+    assert provider.hits.count(ISBN_B) == 3
+    assert reload(db, "2").sinopse == f"Sinopse {ISBN_B}"
+
+
+def test_gives_up_after_max_retries(db, provider):
+    add_book(db, "1", ISBN_A)
+    provider.volumes = {ISBN_A: volume(ISBN_A)}
+    provider.failures = {ISBN_A: [503, 503, 503]}
+
+    job = run(max_retries=1)
+
+    assert job.status == "concluido"
+    assert job.falhas == 1
+    assert provider.hits.count(ISBN_A) == 2
+    assert reload(db, "1").sinopse is None
+
+
+def test_fills_only_empty_fields(db, provider):
+    add_book(db, "1", ISBN_A, sinopse="Sinopse do usuário", subtitulo="", paginas=0)
+    provider.volumes = {ISBN_A: volume(ISBN_A)}
+
+    job = run()
+
+    book = reload(db, "1")
+    assert job.atualizados == 1
+    assert book.sinopse == "Sinopse do usuário"
+    assert book.subtitulo == f"Subtítulo {ISBN_A}"
+    assert book.paginas == 300
+    assert book.capa_url == f"https://covers.example/{ISBN_A}.jpg"
+    assert book.atualizado_em == UPDATED_AT
+
+
+def test_keeps_values_entered_while_job_runs(db):
+    add_book(db, "1", ISBN_A)
+    snapshot = enrichment.load_pending_books(db)
+
+    # O usuário preenche a sinopse depois que o job leu os livros pendentes
+    book = reload(db, "1")
+    book.sinopse = "Digitada pelo usuário"
+    db.commit()
+
+    updates = [{"id": snapshot[0]["id"], "sinopse": "Do provedor", "capa_url": "https://c/1.jpg"}]
+    assert enrichment.save_batch(db, "stand-in", {}, updates) == 1
+
+    book = reload(db, "1")
+    assert book.sinopse == "Digitada pelo usuário"
+    assert book.capa_url == "https://c/1.jpg"
+
+
+def test_second_run_is_served_from_cache(db, provider):
+    add_book(db, "1", ISBN_A)
+    add_book(db, "2", ISBN_B)
+    add_book(db, "3", ISBN_C)
+    # Sem subtítulo no provedor: os livros continuam pendentes para a segunda execução
+    provider.volumes = {ISBN_A: volume(ISBN_A, subtitle=None), ISBN_B: volume(ISBN_B, subtitle=None)}
+
+    first = run()
+    assert first.do_cache == 0
+    assert len(provider.hits) == 3
+
+    second = run()
+    assert second.total == 3
+    assert second.do_cache == 3
+    assert second.atualizados == 0
+    assert len(provider.hits) == 3
+
+
+def test_cache_is_keyed_by_provider_url(db, provider, monkeypatch):
+    add_book(db, "1", ISBN_A)
+    provider.volumes = {ISBN_A: volume(ISBN_A, subtitle=None)}
+    run()
+
+    with StandInProvider() as other:
+        other.volumes = {ISBN_A: volume(ISBN_A)}
+        monkeypatch.setenv("METADATA_PROVIDER_URL", other.url)
+        job = run()
+
+    assert other.hits == [ISBN_A]
+    assert job.do_cache == 0
+    assert reload(db, "1").subtitulo == f"Subtítulo {ISBN_A}"
+
+
+def test_negative_entries_expire(db, provider):
+    add_book(db, "1", ISBN_A)
+    run()
+    assert provider.hits == [ISBN_A]
+
+    # O provedor passa a conhecer o livro, mas a resposta negativa ainda vale
+    provider.volumes = {ISBN_A: volume(ISBN_A)}
+    assert run(negative_ttl_days=30).do_cache == 1
+    assert provider.hits == [ISBN_A]
+
+    db.execute(update(models.MetadataCache).values(buscado_em=datetime(2020, 1, 1)))
+    db.commit()
+    job = run(negative_ttl_days=30)
+
+    assert job.do_cache == 0
+    assert job.atualizados == 1
+    assert provider.hits == [ISBN_A, ISBN_A]
+    assert reload(db, "1").sinopse == f"Sinopse {ISBN_A}"
+    assert db.query(models.MetadataCache).one().dados is not None
+
+
+def add_numbered_books(db, count: int) -> None:
+    for i in range(count):
+        add_book(db, str(i), f"978000000{i:03d}0")
+
+
+def test_respects_concurrency_limit(db, provider):
+    add_numbered_books(db, 12)
+    provider.delay = 0.1
+
+    job = run(concurrency=3, rate_limit=0, batch_size=12)
+
+    assert job.processados == 12
+    assert len(provider.hits) == 12
+    assert provider.max_in_flight == 3
+
+
+def test_run_spans_several_batches(db, provider):
+    add_numbered_books(db, 7)
+    provider.volumes = {f"978000000{i:03d}0": volume(f"978000000{i:03d}0") for i in range(0, 7, 2)}
+
+    job = run(batch_size=3)
+
+    assert (job.total, job.processados) == (7, 7)
+    assert job.atualizados == 4
+    assert job.falhas == 0
+    assert reload(db, "6").sinopse == "Sinopse 9780000000060"
+    assert reload(db, "1").sinopse is None
+    assert db.query(models.MetadataCache).count() == 7
+
+
+def test_jobs_api(db, provider):
+    import main
+
+    add_book(db, "1", ISBN_A)
+    provider.volumes = {ISBN_A: volume(ISBN_A)}
+    client = TestClient(main.app)
+
+    # O TestClient executa a tarefa em segundo plano antes de devolver a resposta
+    started = client.post("/api/enrichment/jobs")
+    assert started.status_code == 202
+    job_id = started.json()["id"]
+    finished = client.get(f"/api/enrichment/jobs/{job_id}").json()
+    assert (finished["status"], finished["total"], finished["atualizados"]) == ("concluido", 1, 1)
+    assert [job["id"] for job in client.get("/api/enrichment/jobs").json()] == [job_id]
+    assert client.get("/api/enrichment/jobs/desconhecido").status_code == 404
+
+    running = enrichment.create_job()
+    assert enrichment.create_job() is None
+    assert client.post("/api/enrichment/jobs").status_code == 409
+    running.status = "concluido"
+    assert client.post("/api/enrichment/jobs").status_code == 202
+
+
+def test_respects_rate_limit(db, provider):
+    add_numbered_books(db, 10)
+    rate_limit = 20
+
+    job = run(concurrency=5, rate_limit=rate_limit, batch_size=10)
+
+    assert job.processados == 10
+    gaps = [b - a for a, b in zip(provider.starts, provider.starts[1:])]
+    assert min(gaps) >= 0.8 / rate_limit
+
+
+def test_rate_limiter_spaces_requests():
+    async def measure():
+        limiter = enrichment.RateLimiter(50)
+        starts = []
+
+        async def request():
+            await limiter.wait()
+            starts.append(time.monotonic())
+
+        await asyncio.gather(*[request() for _ in range(10)])
+        return starts
+
+    starts = sorted(asyncio.run(measure()))
+    assert starts[-1] - starts[0] >= 9 * 0.02 * 0.9
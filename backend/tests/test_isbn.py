@@ -0,0 +1,154 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import crud
+import models
+from isbn import (
+    canonical_isbn13, clean_isbn, is_valid_isbn10, is_valid_isbn13, isbn10_to_isbn13,
+    isbn13_to_isbn10, normalize_isbn10, normalize_isbn13, normalized_isbns
+)
+
+CLEAN_CODE_10 = "0132350882"
+CLEAN_CODE_13 = "9780132350884"
+UPDATED_AT = datetime(2024, 1, 15, 10, 0, 0)
+
+
+def test_clean_isbn_removes_separators():
+    assert clean_isbn("978-0-13-235088-4") == CLEAN_CODE_13
+    assert clean_isbn(" 0-8044-2957-x ") == "080442957X"
+    assert clean_isbn("---") is None
+    assert clean_isbn(None) is None
+
+
+def test_normalize_checks_format_only():
+    assert normalize_isbn10("0-13-235088-2") == CLEAN_CODE_10
+    assert normalize_isbn13("978-0-13-235088-4") == CLEAN_CODE_13
+    # Dígito verificador errado continua normalizado; a validade é conferida à parte
+    assert normalize_isbn13("9780132350885") == "9780132350885"
+    assert normalize_isbn10("0132350881") == "0132350881"
+    assert normalize_isbn10("97801323508") is None
+    assert normalize_isbn13(CLEAN_CODE_10) is None
+    assert normalize_isbn13("978013235088X") is None
+
+
+def test_check_digit_validation():
+    assert is_valid_isbn10(CLEAN_CODE_10)
+    assert is_valid_isbn10("080442957X")
+    assert not is_valid_isbn10("0132350881")
+    assert is_valid_isbn13(CLEAN_CODE_13)
+    assert not is_valid_isbn13("9780132350885")
+
+
+def test_isbn10_isbn13_conversion():
+    assert isbn10_to_isbn13(CLEAN_CODE_10) == CLEAN_CODE_13
+    assert isbn10_to_isbn13("080442957X") == "9780804429573"
+    assert isbn13_to_isbn10(CLEAN_CODE_13) == CLEAN_CODE_10
+    assert isbn13_to_isbn10("9798886450000") is None
+
+
+def test_wrong_check_digit_converges_to_canonical_isbn13():
+    assert canonical_isbn13("0132350881") == CLEAN_CODE_13
+    assert canonical_isbn13("0-13-235088-2") == CLEAN_CODE_13
+    assert canonical_isbn13("abc") is None
+
+
+@pytest.mark.parametrize("isbn10, isbn13, expected", [
+    (CLEAN_CODE_10, None, (CLEAN_CODE_10, CLEAN_CODE_13)),
+    (None, CLEAN_CODE_13, (CLEAN_CODE_10, CLEAN_CODE_13)),
+    ("0-13-235088-2", "978-0-13-235088-4", (CLEAN_CODE_10, CLEAN_CODE_13)),
+    (None, "9798886450000", (None, "9798886450000")),
+    ("invalido", None, (None, None)),
+    (None, None, (None, None)),
+])
+def test_normalized_isbns_derives_one_from_the_other(isbn10, isbn13, expected):
+    assert normalized_isbns(isbn10, isbn13) == expected
+
+
+def add_book(db, book_id: str, **fields) -> models.Book:
+    values = {
+        "titulo": f"Livro {book_id}",
+        "autores": ["Autor"],
+        "editora": "Editora",
+        "paginas": 100,
+        "formato": "fisico",
+        "idioma": "Português",
+        "tags": [],
+        "criado_em": UPDATED_AT,
+        "atualizado_em": UPDATED_AT,
+    }
+    values.update(fields)
+    book = models.Book(id=book_id, **values)
+    db.add(book)
+    db.commit()
+    return book
+
+
+def test_books_are_normalized_on_save(db):
+    book = add_book(db, "1", isbn10="0-13-235088-2")
+    assert book.isbn13_normalizado == CLEAN_CODE_13
+
+    book.isbn10 = None
+    book.isbn13 = "978-0-201-63361-0"
+    db.commit()
+    assert book.isbn13_normalizado == "9780201633610"
+
+
+def test_get_book_by_isbn_accepts_both_formats(db):
+    add_book(db, "1", isbn13=CLEAN_CODE_13)
+
+    assert crud.get_book_by_isbn(db, CLEAN_CODE_10).id == "1"
+    assert crud.get_book_by_isbn(db, "978-0-13-235088-4").id == "1"
+    assert crud.get_book_by_isbn(db, "9780201633610") is None
+    assert crud.get_book_by_isbn(db, "abc") is None
+
+
+def test_find_isbn_conflict(db):
+    add_book(db, "1", isbn13=CLEAN_CODE_13)
+
+    assert crud.find_isbn_conflict(db, CLEAN_CODE_10, None).id == "1"
+    assert crud.find_isbn_conflict(db, None, CLEAN_CODE_13, exclude_id="1") is None
+    assert crud.find_isbn_conflict(db, None, "9780201633610") is None
+
+
+def test_backfill_fills_legacy_rows_and_keeps_updated_at(db):
+    add_book(db, "1", isbn10=CLEAN_CODE_10)
+    add_book(db, "2", isbn13="9780201633611")  # dígito verificador errado
+    add_book(db, "3", isbn13="sem isbn")
+    db.execute(text("UPDATE books SET isbn10_normalizado = NULL, isbn13_normalizado = NULL"))
+    db.commit()
+
+    assert crud.backfill_isbns(db) == 2
+    db.expire_all()
+    first, second, third = (db.get(models.Book, book_id) for book_id in ("1", "2", "3"))
+    assert first.isbn13_normalizado == CLEAN_CODE_13
+    assert second.isbn13_normalizado == "9780201633611"
+    assert third.isbn13_normalizado is None
+    assert first.atualizado_em == UPDATED_AT
+
+    assert crud.backfill_isbns(db) == 0
+
+
+def test_api_rejects_duplicate_isbn_with_409(db):
+    import main
+
+    payload = {
+        "titulo": "Clean Code", "autores": ["Robert C. Martin"], "editora": "Prentice Hall",
+        "paginas": 464, "formato": "fisico", "idioma": "Inglês", "isbn13": CLEAN_CODE_13,
+    }
+    client = TestClient(main.app)
+    created = client.post("/api/books", json=payload)
+    assert created.status_code == 201
+
+    duplicate = client.post("/api/books", json={**payload, "isbn13": None, "isbn10": "0-13-235088-2"})
+    assert duplicate.status_code == 409
+
+    other = client.post("/api/books", json={**payload, "isbn13": "9780201633610"})
+    assert other.status_code == 201
+    conflict = client.put(f"/api/books/{other.json()['id']}", json={"isbn13": CLEAN_CODE_13})
+    assert conflict.status_code == 409
+    assert client.put(f"/api/books/{created.json()['id']}", json={"isbn13": CLEAN_CODE_13}).status_code == 200
+
+    assert client.get(f"/api/books/by-isbn/{CLEAN_CODE_10}").json()["id"] == created.json()["id"]
@@ -0,0 +1,90 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import similarity
+from similarity import SimilarityIndex
+
+
+def book(book_id: str, tags=(), autores=(), editora=None, idioma="pt"):
+    return SimpleNamespace(id=book_id, tags=list(tags), autores=list(autores), editora=editora, idioma=idioma)
+
+
+def build(books) -> SimilarityIndex:
+    index = SimilarityIndex()
+    index.build([(b.id, b.tags, b.autores, b.editora, b.idioma) for b in books])
+    return index
+
+
+def same_results(a, b) -> bool:
+    # Empates no último score podem trazer qualquer um dos livros empatados
+    if len(a) != len(b) or any(abs(x[1] - y[1]) > 1e-5 for x, y in zip(a, b)):
+        return False
+    last = a[-1][1] if a else 0
+    return [x[0] for x in a if x[1] > last + 1e-5] == [y[0] for y in b if y[1] > last + 1e-5]
+
+
+def test_common_features_alone_do_not_make_pending_rows_similar():
+    index = build([book(str(i), tags=[f"t{i}"], autores=[f"a{i}"], editora=f"e{i}") for i in range(50)])
+    assert index.similar("0") == []
+
+    # Só o idioma (presente em todo o acervo) em comum, como nos livros já compactados
+    index.add(book("novo", tags=["outra"], autores=["outro"], editora="outra"))
+    assert index.similar("0") == []
+
+    index.add(book("irmao", tags=["t0"], autores=["outro"]))
+    assert [book_id for book_id, _ in index.similar("0")] == ["irmao"]
+
+
+def test_removed_and_updated_books_leave_the_results():
+    index = build([
+        book("1", tags=["python"], autores=["guido"], idioma=None),
+        book("2", tags=["python"], autores=["guido"], idioma=None),
+        book("3", tags=["python"], idioma=None),
+    ])
+    assert [book_id for book_id, _ in index.similar("1")] == ["2", "3"]
+
+    index.remove("2")
+    index.add(book("3", tags=["rust"], idioma=None))
+    assert index.similar("1") == []
+    assert "2" not in index
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_mutations_across_background_compactions_match_fresh_build(monkeypatch, seed):
+    monkeypatch.setattr(similarity, "COMPACT_THRESHOLD", 25)
+    rng = random.Random(seed)
+    tags = [f"t{i}" for i in range(150)]
+    authors = [f"a{i}" for i in range(300)]
+
+    def random_book(book_id):
+        return book(
+            book_id, rng.sample(tags, rng.randint(0, 3)), rng.sample(authors, rng.randint(1, 2)),
+            rng.choice(["e1", "e2", "e3", None]), rng.choice(["pt", "pt", "pt", "en"])
+        )
+
+    books = {str(i): random_book(str(i)) for i in range(200)}
+    index = build(books.values())
+    next_id = 200
+    for _ in range(1500):
+        op = rng.random()
+        if op < 0.4:
+            new = random_book(str(next_id))
+            next_id += 1
+            books[new.id] = new
+            index.add(new)
+        elif op < 0.6:
+            index.remove(books.pop(rng.choice(list(books))).id)
+        else:
+            updated = random_book(rng.choice(list(books)))
+            books[updated.id] = updated
+            index.add(updated)
+
+    fresh = build(books.values())
+    queries = rng.sample(list(books), 100)
+    # Com a compactação ainda em andamento, com pendências e depois da troca
+    assert all(same_results(index.similar(q, 5), fresh.similar(q, 5)) for q in queries)
+    index.wait_for_compaction()
+    assert all(same_results(index.similar(q, 5), fresh.similar(q, 5)) for q in queries)
+    assert len(index) == len(fresh)
@@ -0,0 +1,119 @@
+import random
+
+import numpy as np
+import pytest
+
+import suggest
+from suggest import SuggestIndex, book_terms
+
+WORDS = ["amor", "arte", "ana", "anel", "bola", "bolo", "casa", "cão", "dado", "ação", "água", "zeta"]
+
+
+def build(rows) -> SuggestIndex:
+    index = SuggestIndex()
+    index.build(rows)
+    return index
+
+
+def same_suggestions(a, b) -> bool:
+    # Empates na última contagem podem trazer qualquer um dos termos empatados
+    if [x["livros"] for x in a] != [y["livros"] for y in b]:
+        return False
+    last = a[-1]["livros"] if a else 0
+    return (
+        [(x["texto"], x["tipo"]) for x in a if x["livros"] > last]
+        == [(y["texto"], y["tipo"]) for y in b if y["livros"] > last]
+    )
+
+
+def test_short_prefix_ranks_the_whole_range(monkeypatch):
+    monkeypatch.setattr(suggest, "SCAN_LIMIT", 64)
+    index = build([(f"Paa {i}", [], None, []) for i in range(200)] + [("Python", [], None, [])] * 500)
+
+    assert index.suggest("p", 5)[0] == {"texto": "Python", "tipo": "titulo", "livros": 500}
+
+
+def test_pending_terms_are_bounded_and_ranked(monkeypatch):
+    monkeypatch.setattr(suggest, "COMPACT_THRESHOLD", 10 ** 9)
+    index = build([("Dom Casmurro", ["Machado de Assis"], None, [])])
+    for i in range(500):
+        index.add_terms([("titulo", f"Aventura {i}")])
+    index.add_terms([("autor", "Agatha Christie")] * 3)
+
+    assert len(index._candidates("a")) <= suggest.TOP_N + 1
+    assert index.suggest("a", 1) == [{"texto": "Agatha Christie", "tipo": "autor", "livros": 3}]
+    assert index.suggest("assis") == [{"texto": "Machado de Assis", "tipo": "autor", "livros": 1}]
+
+
+def test_removed_terms_disappear():
+    index = build([("Clean Code", ["Robert C. Martin"], "Prentice Hall", ["programação"])])
+    index.remove_terms(book_terms("Clean Code", ["Robert C. Martin"], "Prentice Hall", ["programação"]))
+
+    assert index.suggest("clean") == []
+    assert len(index) == 0
+
+
+def test_latin_letters_are_transliterated_and_unindexable_terms_skipped():
+    index = build([
+        ("Łódź", ["Søren Kierkegaard"], None, ["Straße"]),
+        ("Война и мир", ["Лев Толстой"], None, []),
+    ])
+
+    assert [s["texto"] for s in index.suggest("lod")] == ["Łódź"]
+    assert index.suggest("odz") == []
+    assert [s["texto"] for s in index.suggest("soren")] == ["Søren Kierkegaard"]
+    assert [s["texto"] for s in index.suggest("strasse")] == ["Straße"]
+    assert len(index) == 3
+    assert book_terms("Война и мир", ["Лев Толстой"], None, []) == []
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_mutations_across_background_compactions_match_fresh_build(monkeypatch, seed):
+    monkeypatch.setattr(suggest, "COMPACT_THRESHOLD", 60)
+    monkeypatch.setattr(suggest, "SCAN_LIMIT", 20)
+    monkeypatch.setattr(suggest, "TOP_N", 8)
+    rng = random.Random(seed)
+
+    def random_row():
+        return (
+            " ".join(rng.choices(WORDS, k=rng.randint(1, 3))),
+            [f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}"],
+            rng.choice(WORDS),
+            rng.sample(WORDS, 2),
+        )
+
+    books = {i: random_row() for i in range(300)}
+    index = build(books.values())
+    next_id = 300
+    for _ in range(3000):
+        op = rng.random()
+        if op < 0.4:
+            books[next_id] = random_row()
+            index.add_terms(book_terms(*books[next_id]))
+            next_id += 1
+        elif op < 0.7:
+            index.remove_terms(book_terms(*books.pop(rng.choice(list(books)))))
+        else:
+            book_id = rng.choice(list(books))
+            old = book_terms(*books[book_id])
+            books[book_id] = random_row()
+            index.remove_terms(old)
+            index.add_terms(book_terms(*books[book_id]))
+
+        # Todo termo com livros precisa ter chaves nos arrays ou nas pendências
+        with index._lock:
+            indexed = set(index._key_terms.tolist()) | set(index._pending_terms.tolist())
+            assert set(np.flatnonzero(index._counts).tolist()) <= indexed
+
+    # As listas pré-calculadas só se atualizam na compactação: força uma final
+    index.wait_for_compaction()
+    index._start_compaction()
+    index.wait_for_compaction()
+
+    fresh = build(books.values())
+    assert len(index) == len(fresh)
+    assert sorted(index._keys.tolist()) == sorted(fresh._keys.tolist())
+    queries = {word[:n] for word in WORDS for n in range(1, len(word) + 1)}
+    for query in sorted(queries):
+        for limit in (3, 10):
+            assert same_suggestions(index.suggest(query, limit), fresh.suggest(query, limit)), query